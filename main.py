@@ -1,14 +1,19 @@
 import argparse
 import asyncio
+import codecs
 import datetime
-import email
 import imaplib
 import json
 import os
+import random
 import re
 import sys
+import time
+from collections import deque
+from contextlib import asynccontextmanager
 from email.header import decode_header
 from email.utils import parsedate_to_datetime
+from functools import lru_cache
 from typing import List, Dict, Any
 
 # Third-party imports
@@ -26,9 +31,29 @@ import hashlib
 SCOPES = ['https://mail.google.com/']
 TOKEN_PATH = 'token.json'
 CHUNK_SIZE = 250  # Reduced for more reliable processing and frequent commits
-EMAILS_PER_COMMIT = 20  # Commit after processing this many emails
+EMAILS_PER_COMMIT = 250  # Commit after processing this many emails; with CHUNK_SIZE = 250 this is one commit per chunk
+FETCH_BATCH_SIZE = 100  # UIDs requested per IMAP UID FETCH command in headers mode
+FULL_FETCH_BATCH_SIZE = 20  # UIDs per UID FETCH in full mode (smaller: each message can be megabytes)
+CONCURRENT_FETCHES = 8  # Upper bound on batch fetches in flight (further limited by the number of connections)
+MAX_IMAP_CONNECTIONS = 15  # Gmail allows at most 15 simultaneous IMAP connections per account
+IMAP_KEEPALIVE_SECONDS = 25 * 60  # Send a NOOP before reusing a connection idle this long
+RECONNECT_MIN_INTERVAL = 2.0  # Seconds between IMAP logins across all connections, to avoid tripping server limits
+RETRY_BACKOFF_SECONDS = 60  # Wait before retrying a failed UID, doubled after each further failure
+RETRY_BACKOFF_MAX_SECONDS = 24 * 3600  # Upper bound for the failed-UID retry delay
+COMMIT_RETRY_DELAYS = tuple(min(0.1 * 2 ** i, 5.0) for i in range(8))  # Backoff caps (seconds) between commit attempts
+ATTACHMENT_PAGE_SIZE = 100  # Emails read from full_emails per query when extracting attachments
+IMAP_CONNECTION_ERRORS = (imaplib.IMAP4.abort, OSError)  # Errors that mean the IMAP connection is gone and needs a reconnect
+
+# Header fields requested in headers mode - only the ones stored in the emails table
+HEADER_FIELDS = ('FROM', 'TO', 'CC', 'SUBJECT', 'DATE')
+HEADER_FETCH_ITEM = f"BODY.PEEK[HEADER.FIELDS ({' '.join(HEADER_FIELDS)})]"
 DEBUG = False   # Enable debug mode - set to False by default for full processing
 
+# Write statements used on the sync hot path. sqlite3 keeps compiled statements
+# in a per-connection cache keyed by SQL text, so every caller shares one entry.
+SAVE_EMAIL_HEADER_SQL = 'INSERT OR REPLACE INTO emails(uid, msg_from, msg_to, msg_cc, subject, msg_date, mailbox) VALUES(?,?,?,?,?,?,?)'
+SAVE_FULL_EMAIL_SQL = 'INSERT OR REPLACE INTO full_emails(uid, mailbox, raw_email, fetched_at) VALUES(?,?,?,?)'
+
 # Predefined queries
 QUERIES = {
     'top_senders': {
@@ -283,9 +308,21 @@ METRIC_QUERIES = {
     },
 }
 
-def debug_print(*args, **kwargs):
-    if DEBUG:
-        print(*args, **kwargs)
+def _skip_debug_print(*args, **kwargs):
+    pass
+
+# debug_print is bound to print or to a no-op, so disabled calls skip the DEBUG check
+def set_debug(enabled):
+    """Enable or disable debug output"""
+    global DEBUG, debug_print
+    DEBUG = bool(enabled)
+    debug_print = print if DEBUG else _skip_debug_print
+
+set_debug(DEBUG)
+
+def _now_iso():
+    """Current local time as an ISO 8601 string (used for all sync timestamps)"""
+    return datetime.datetime.now().isoformat()
 
 # Unified checkpoint system
 class CheckpointManager:
@@ -300,6 +337,7 @@ class CheckpointManager:
         self.mailbox = mailbox if mailbox else 'INBOX'
         self.checkpoint_path = f'checkpoint_{mode}.json'
         self.state = self._load_state()
+        self._failed_index = None  # Set of the current mailbox's failed UIDs, built on first use
         
         # Initialize mailbox state if it doesn't exist
         if self.mailbox not in self.state:
@@ -324,7 +362,7 @@ class CheckpointManager:
     
     def save_state(self):
         """Save current state to checkpoint file"""
-        self.state[self.mailbox]['timestamp'] = datetime.datetime.now().isoformat()
+        self.state[self.mailbox]['timestamp'] = _now_iso()
         try:
             with open(self.checkpoint_path, 'w') as f:
                 json.dump(self.state, f, indent=2)
@@ -334,6 +372,7 @@ class CheckpointManager:
     def set_mailbox(self, mailbox):
         """Set current mailbox and initialize state if needed"""
         self.mailbox = mailbox if mailbox else 'INBOX'
+        self._failed_index = None
         if self.mailbox not in self.state:
             self.state[self.mailbox] = {
                 'last_uid': 0,
@@ -353,22 +392,58 @@ class CheckpointManager:
         self.save_state()
     
     def update_progress(self, uid):
-        """Update the last processed UID"""
+        """Update the last processed UID in memory
+        
+        Progress is written to disk by save_state, which callers invoke
+        only after a successful database commit so the file never runs
+        ahead of what has been committed.
+        """
         # Only update if this UID is greater than the last one
         uid_int = int(uid)
         if uid_int > self.state[self.mailbox]['last_uid']:
             self.state[self.mailbox]['last_uid'] = uid_int
-            # Only save periodically to avoid excessive disk writes
-            if uid_int % 100 == 0:  # Save more frequently (was 500)
-                self.save_state()
     
+    def _failed_set(self):
+        """Set of the failed UIDs, kept in step with the failed list
+        
+        It is only built once a membership test is needed, so syncs with a
+        long failed list that never touch it pay nothing for it.
+        """
+        if self._failed_index is None:
+            self._failed_index = set(self.state[self.mailbox]['failed_uids'])
+        return self._failed_index
+        
     def add_failed_uid(self, uid):
-        """Add a UID to the failed list"""
-        if uid not in self.state[self.mailbox]['failed_uids']:
-            self.state[self.mailbox]['failed_uids'].append(uid)
-            # Only save periodically to avoid excessive disk writes
-            if len(self.state[self.mailbox]['failed_uids']) % 100 == 0:
-                self.save_state()
+        """Add a UID to the failed list (saved with the next save_state)"""
+        self.add_failed_uids([uid])
+        
+    def _retry_schedule(self):
+        """Map of failed UID -> [failed attempts, earliest retry time as a Unix timestamp]"""
+        # Checkpoints written before retries were scheduled have no entry yet
+        return self.state[self.mailbox].setdefault('retry_after', {})
+        
+    def _schedule_retries(self, uids):
+        """Push back the next retry of each UID with exponential backoff and jitter"""
+        schedule = self._retry_schedule()
+        now = time.time()
+        for uid in uids:
+            attempts = schedule.get(uid, [0, 0])[0] + 1
+            delay = min(RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1), RETRY_BACKOFF_MAX_SECONDS)
+            schedule[uid] = [attempts, now + delay + RETRY_BACKOFF_SECONDS * random.random()]
+            
+    def get_retry_uids(self):
+        """Get the failed UIDs whose retry delay has passed"""
+        schedule = self._retry_schedule()
+        now = time.time()
+        return [uid for uid in self.state[self.mailbox]['failed_uids']
+                if uid not in schedule or schedule[uid][1] <= now]
+    
+    def get_deferred_uids(self):
+        """Get the set of failed UIDs that are still waiting out their retry delay"""
+        schedule = self._retry_schedule()
+        now = time.time()
+        return set(uid for uid in self.state[self.mailbox]['failed_uids']
+                   if uid in schedule and schedule[uid][1] > now)
     
     def get_last_uid(self):
         """Get the last successfully processed UID"""
@@ -380,8 +455,35 @@ class CheckpointManager:
     
     def clear_failed_uid(self, uid):
         """Remove a UID from the failed list if it's been processed successfully"""
-        if uid in self.state[self.mailbox]['failed_uids']:
-            self.state[self.mailbox]['failed_uids'].remove(uid)
+        self.clear_failed_uids([uid])
+            
+    def update_progress_bulk(self, uids):
+        """Update the last processed UID from a batch of processed UIDs"""
+        if uids:
+            self.update_progress(max(uids, key=int))
+            
+    def add_failed_uids(self, uids):
+        """Add several UIDs to the failed list in one pass (saved with the next save_state)"""
+        failed = self.state[self.mailbox]['failed_uids']
+        known = self._failed_set()
+        uids = list(dict.fromkeys(uids))
+        new_uids = [uid for uid in uids if uid not in known]
+        failed.extend(new_uids)
+        known.update(new_uids)
+        self._schedule_retries(uids)
+            
+    def clear_failed_uids(self, uids):
+        """Remove several UIDs from the failed list in one pass"""
+        known = self._failed_set()
+        cleared = known.intersection(uids)
+        if cleared:
+            # Update in place: EmailSyncer keeps a reference to this list
+            failed = self.state[self.mailbox]['failed_uids']
+            failed[:] = [uid for uid in failed if uid not in cleared]
+            known.difference_update(cleared)
+            schedule = self._retry_schedule()
+            for uid in cleared:
+                schedule.pop(uid, None)
             
     def was_interrupted(self):
         """Check if a previous sync was interrupted"""
@@ -409,17 +511,16 @@ class DatabaseManager:
         """Commit transaction with retry logic"""
         for attempt in range(max_retries):
             try:
+                # sqlite3 opens the next transaction implicitly on the next write
                 await self.db.commit()
-                try:
-                    await self.db.execute("BEGIN TRANSACTION")
-                except:
-                    pass  # Transaction already started
                 return True
             except Exception as e:
                 if attempt == max_retries - 1:
                     print(f"Failed to commit after {max_retries} attempts: {e}")
                     return False
-                await asyncio.sleep(0.1 * (attempt + 1))  # Exponential backoff
+                # Exponential backoff with full jitter, so concurrent writers don't retry in lockstep
+                cap = COMMIT_RETRY_DELAYS[min(attempt, len(COMMIT_RETRY_DELAYS) - 1)]
+                await asyncio.sleep(cap * random.random())
         
     async def setup_schema(self):
         """Set up the database schema"""
@@ -428,6 +529,7 @@ class DatabaseManager:
         await self.db.execute("PRAGMA synchronous=NORMAL;")
         await self.db.execute("PRAGMA temp_store=MEMORY;")
         await self.db.execute("PRAGMA cache_size=-50000;")  # Use about 50MB of memory for caching
+        await self.db.execute("PRAGMA mmap_size=268435456;")  # Memory-map up to 256MB of the database file
         await self.db.execute("PRAGMA foreign_keys=OFF;")   # Disable foreign key checks for imports
         
         # Create emails table if it doesn't exist
@@ -609,26 +711,19 @@ class DatabaseManager:
         missing_columns = [col for col in required_columns if col not in columns]
         if missing_columns:
             print(f"Missing columns in full_emails: {missing_columns}. Recreating table...")
-            # Get current data
-            existing_data = []
-            try:
-                async with self.db.execute("SELECT uid, mailbox, raw_email, fetched_at FROM full_emails") as cursor:
-                    existing_data = await cursor.fetchall()
-            except Exception as e:
-                print(f"Error fetching existing data: {e}")
-            
             # Create new table
             await self.db.execute("DROP TABLE IF EXISTS full_emails_new")
             await self._create_full_emails_table('full_emails_new')
             
-            # Copy data
-            if existing_data:
-                print(f"Copying {len(existing_data)} existing emails to new table structure...")
-                for row in existing_data:
-                    await self.db.execute(
-                        "INSERT INTO full_emails_new (uid, mailbox, raw_email, fetched_at) VALUES (?, ?, ?, ?)",
-                        row
-                    )
+            # Copy data inside SQLite in one statement, without round-tripping rows through Python
+            try:
+                async with self.db.execute(
+                    "INSERT INTO full_emails_new (uid, mailbox, raw_email, fetched_at) "
+                    "SELECT uid, mailbox, raw_email, fetched_at FROM full_emails"
+                ) as cursor:
+                    print(f"Copied {cursor.rowcount} existing emails to new table structure")
+            except Exception as e:
+                print(f"Error copying existing data: {e}")
             
             # Replace old table
             await self.db.execute("DROP TABLE IF EXISTS full_emails")
@@ -677,7 +772,7 @@ class DatabaseManager:
         await self.db.execute('''
             INSERT INTO sync_status (start_time, status, message)
             VALUES (?, 'STARTED', ?)
-        ''', (datetime.datetime.now().isoformat(), message))
+        ''', (_now_iso(), message))
         async with self.db.execute('SELECT last_insert_rowid()') as cursor:
             row = await cursor.fetchone()
             return row[0] if row else None
@@ -686,18 +781,43 @@ class DatabaseManager:
         """Log the completion of a sync operation"""
         await self.db.execute(
             "UPDATE sync_status SET end_time = ?, status = ?, message = ? WHERE id = ?", 
-            (datetime.datetime.now().isoformat(), status, message, status_id)
+            (_now_iso(), status, message, status_id)
         )
         await self.db.commit()
+        
+    async def save_email_headers_bulk(self, rows):
+        """Insert or replace several email header rows with a single executemany
+        
+        Each row is a (uid, msg_from, msg_to, msg_cc, subject, msg_date, mailbox) tuple.
+        """
+        if rows:
+            await self.db.executemany(SAVE_EMAIL_HEADER_SQL, rows)
+            
+    async def save_full_emails_bulk(self, rows):
+        """Insert or replace several raw emails with a single executemany
+        
+        Each row is a (uid, mailbox, raw_email, fetched_at) tuple.
+        """
+        if rows:
+            await self.db.executemany(SAVE_FULL_EMAIL_SQL, rows)
 
 # Unified IMAP client
 class ImapClient:
+    # Reconnects are serialized and spaced out across every client (e.g. a whole pool)
+    # of the running event loop; the lock is recreated for each new loop
+    _reconnect_lock = None
+    _reconnect_loop = None
+    _last_reconnect = 0.0
+    
     def __init__(self, host, user, creds):
         self.host = host
         self.user = user
         self.creds = creds
         self.imap = None
         self.current_mailbox = None
+        self.current_readonly = None
+        self.connection_count = 1
+        self.last_used = time.monotonic()
         self.loop = asyncio.get_event_loop()
         
     async def connect(self):
@@ -711,6 +831,10 @@ class ImapClient:
         
     def _login_oauth2(self):
         """Authenticate with IMAP server using OAuth2"""
+        # Access tokens expire after about an hour; reconnects during a long
+        # sync need a fresh one
+        if self.creds.expired and self.creds.refresh_token:
+            self.creds.refresh(Request())
         imap = imaplib.IMAP4_SSL(self.host)
         auth_string = f"user={self.user}\x01auth=Bearer {self.creds.token}\x01\x01"
         imap.authenticate('XOAUTH2', lambda x: auth_string)
@@ -723,40 +847,130 @@ class ImapClient:
                 return f'"{mailbox}"'
         return mailbox
         
+    async def _reconnect(self):
+        """Replace a dropped connection with a freshly authenticated one"""
+        print("IMAP connection lost, reconnecting...")
+        self._invalidate_mailbox()
+        try:
+            self.imap.shutdown()
+        except Exception:
+            pass
+            
+        async with self._reconnect_guard():
+            wait = ImapClient._last_reconnect + RECONNECT_MIN_INTERVAL - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                await self.connect()
+            finally:
+                ImapClient._last_reconnect = time.monotonic()
+        
+    @classmethod
+    def _reconnect_guard(cls):
+        """Return the reconnect lock for the running event loop, creating it on first use"""
+        loop = asyncio.get_running_loop()
+        if cls._reconnect_loop is not loop:
+            # An asyncio.Lock cannot be shared across event loops (e.g. repeated asyncio.run)
+            cls._reconnect_lock = asyncio.Lock()
+            cls._reconnect_loop = loop
+        return cls._reconnect_lock
+        
+    async def _keepalive(self):
+        """Check a long-idle connection with NOOP, reconnecting if the server dropped it"""
+        if time.monotonic() - self.last_used < IMAP_KEEPALIVE_SECONDS:
+            return
+        try:
+            await self.loop.run_in_executor(None, lambda: self.imap.noop())
+        except IMAP_CONNECTION_ERRORS:
+            await self._reconnect()
+        self.last_used = time.monotonic()
+        
+    async def _recover(self, error):
+        """Reset state after a failed command, reconnecting if the connection was dropped"""
+        # The connection state is unknown after an error, so re-select next time
+        self._invalidate_mailbox()
+        if isinstance(error, IMAP_CONNECTION_ERRORS):
+            try:
+                await self._reconnect()
+            except Exception as e:
+                print(f"Reconnect failed: {e}")
+                
+    async def _run_command(self, command):
+        """Run a blocking imaplib call in the executor, recovering the connection if it fails"""
+        try:
+            result = await self.loop.run_in_executor(None, command)
+        except Exception as e:
+            await self._recover(e)
+            raise
+        self.last_used = time.monotonic()
+        return result
+        
     async def select_mailbox(self, mailbox, readonly=True):
-        """Select a mailbox"""
-        if self.current_mailbox == mailbox:
+        """Select a mailbox, skipping the SELECT if it is already selected"""
+        await self._keepalive()
+        if self.current_mailbox == mailbox and self.current_readonly == readonly:
             return True
             
         quoted_mailbox = self._quote_mailbox_if_needed(mailbox)
-            
-        status, _ = await self.loop.run_in_executor(
-            None, lambda: self.imap.select(quoted_mailbox, readonly=readonly)
+        
+        # A failed or interrupted SELECT leaves no mailbox selected on the server
+        self._invalidate_mailbox()
+        status, _ = await self._run_command(
+            lambda: self.imap.select(quoted_mailbox, readonly=readonly)
         )
         if status == 'OK':
             self.current_mailbox = mailbox
+            self.current_readonly = readonly
             return True
         else:
             print(f"Failed to select mailbox {mailbox}: {status}")
             return False
             
-    async def fetch(self, uid, fetch_type='headers'):
-        """Fetch email data by UID"""
+    def _invalidate_mailbox(self):
+        """Forget the selected mailbox so the next select_mailbox issues a SELECT"""
+        self.current_mailbox = None
+        self.current_readonly = None
+            
+    async def fetch_many(self, uids, fetch_type='headers'):
+        """Fetch email data for several UIDs with a single UID FETCH command
+        
+        Returns the status and a dict mapping each UID the server answered
+        for to its data. UIDs missing from the dict were not returned.
+        """
         fetch_command = None
         if fetch_type == 'headers':
-            fetch_command = '(BODY.PEEK[HEADER.FIELDS (FROM TO CC SUBJECT DATE)])'
+            fetch_command = f'(UID {HEADER_FETCH_ITEM})'
         elif fetch_type == 'full':
-            fetch_command = '(BODY.PEEK[])'
+            fetch_command = '(UID BODY.PEEK[])'
             
-        status, data = await self.loop.run_in_executor(
-            None, lambda: self.imap.uid('FETCH', uid, fetch_command)
+        uid_set = compact_uid_set(uids)
+        status, data = await self._run_command(
+            lambda: self.imap.uid('FETCH', uid_set, fetch_command)
         )
-        return status, data
+        if status != 'OK':
+            return status, {}
+        # Ignore anything the server sent for UIDs outside this batch
+        requested = set(str(uid) for uid in uids)
+        return status, {uid: item for uid, item in iter_imap_response(data) if uid in requested}
         
     async def search_all(self):
         """Search for all messages in the current mailbox"""
-        status, data = await self.loop.run_in_executor(
-            None, lambda: self.imap.uid('SEARCH', None, 'ALL')
+        status, data = await self._run_command(
+            lambda: self.imap.uid('SEARCH', None, 'ALL')
+        )
+        if status != 'OK':
+            return []
+            
+        uid_list = data[0].decode().split() if isinstance(data[0], bytes) else data[0].split()
+        return list(map(str, uid_list))
+        
+    async def search_uid_range(self, uid_set):
+        """Search for the messages of the current mailbox within an IMAP UID set, e.g. "1001:*"
+        
+        Note that "n:*" also matches the highest UID when it is below n.
+        """
+        status, data = await self._run_command(
+            lambda: self.imap.uid('SEARCH', None, f'UID {uid_set}')
         )
         if status != 'OK':
             return []
@@ -772,8 +986,8 @@ class ImapClient:
         """
         try:
             # First try to get message count
-            status, data = await self.loop.run_in_executor(
-                None, lambda: self.imap.status(self.current_mailbox, '(MESSAGES)')
+            status, data = await self._run_command(
+                lambda: self.imap.status(self.current_mailbox, '(MESSAGES)')
             )
             
             if status != 'OK':
@@ -803,8 +1017,8 @@ class ImapClient:
                 end = min(start + chunk_size - 1, message_count)
                 sequence_set = f"{start}:{end}"
                 
-                status, data = await self.loop.run_in_executor(
-                    None, lambda: self.imap.fetch(sequence_set, '(UID)')
+                status, data = await self._run_command(
+                    lambda: self.imap.fetch(sequence_set, '(UID)')
                 )
                 
                 if status != 'OK':
@@ -819,6 +1033,9 @@ class ImapClient:
                             all_uids.append(match.group(1))
             
             return all_uids
+        except IMAP_CONNECTION_ERRORS:
+            # The connection was replaced and no mailbox is selected any more
+            raise
         except Exception as e:
             print(f"Error in search_chunked: {e}")
             # Fall back to normal search
@@ -873,8 +1090,8 @@ class ImapClient:
                     
                     try:
                         # Search with date range
-                        status, data = await self.loop.run_in_executor(
-                            None, lambda: self.imap.uid('SEARCH', None, f'(SINCE "{date_start}" BEFORE "{date_end}")')
+                        status, data = await self._run_command(
+                            lambda: self.imap.uid('SEARCH', None, f'(SINCE "{date_start}" BEFORE "{date_end}")')
                         )
                         
                         if status != 'OK':
@@ -885,21 +1102,24 @@ class ImapClient:
                         if uids and len(uids) > 0:
                             all_uids.extend(uids)
                             print(f"  Found {len(uids)} messages for {['Jan','Feb','Mar','Apr','May','Jun','Jul','Aug','Sep','Oct','Nov','Dec'][month-1]} {year}")
+                    except IMAP_CONNECTION_ERRORS:
+                        raise
                     except Exception as e:
                         print(f"Error searching {date_start} to {date_end}: {e}")
                         # Continue to next chunk, don't let one failed chunk stop the whole process
                         continue
             
             return all_uids
+        except IMAP_CONNECTION_ERRORS:
+            # The connection was replaced and no mailbox is selected any more
+            raise
         except Exception as e:
             print(f"Error in search_by_date_chunks: {e}")
             return []
         
     async def list_mailboxes(self):
         """List all available mailboxes"""
-        status, mailboxes = await self.loop.run_in_executor(
-            None, lambda: self.imap.list()
-        )
+        status, mailboxes = await self._run_command(lambda: self.imap.list())
         if status != 'OK':
             return []
             
@@ -927,6 +1147,92 @@ class ImapClient:
             except Exception as e:
                 print(f"Error during logout: {e}")
 
+# Pool of IMAP connections for the same account
+class ImapClientPool:
+    def __init__(self, host, user, creds, size=2):
+        """Initialize a pool of IMAP connections
+        
+        The pool exposes the ImapClient methods used by the sync code. Each
+        operation runs on an idle connection, preferring one that already
+        has the target mailbox selected, so every connection only issues a
+        SELECT when it switches mailboxes.
+        
+        Args:
+            host: IMAP host
+            user: Gmail address
+            creds: OAuth2 credentials
+            size: Number of connections to open
+        """
+        self.clients = [ImapClient(host, user, creds) for _ in range(max(1, size))]
+        self.connection_count = len(self.clients)
+        self.current_mailbox = None
+        self._idle = []
+        self._available = asyncio.Semaphore(len(self.clients))
+        
+    async def connect(self):
+        """Open all connections in the pool"""
+        await asyncio.gather(*(client.connect() for client in self.clients))
+        self._idle = list(self.clients)
+        
+    @asynccontextmanager
+    async def _connection(self, mailbox=None):
+        """Borrow an idle connection, with `mailbox` selected if given"""
+        await self._available.acquire()
+        # Prefer a connection that already has this mailbox selected
+        client = next((c for c in self._idle if c.current_mailbox == mailbox), self._idle[0])
+        self._idle.remove(client)
+        try:
+            if mailbox and not await client.select_mailbox(mailbox):
+                raise imaplib.IMAP4.error(f"Failed to select mailbox {mailbox}")
+            yield client
+        finally:
+            self._idle.append(client)
+            self._available.release()
+            
+    async def select_mailbox(self, mailbox, readonly=True):
+        """Select the mailbox used by subsequent fetches and searches"""
+        if self.current_mailbox == mailbox:
+            return True
+        async with self._connection() as client:
+            if not await client.select_mailbox(mailbox, readonly=readonly):
+                return False
+        self.current_mailbox = mailbox
+        return True
+        
+    async def fetch_many(self, uids, fetch_type='headers'):
+        """Fetch email data for several UIDs on an idle connection"""
+        async with self._connection(self.current_mailbox) as client:
+            return await client.fetch_many(uids, fetch_type)
+            
+    async def search_all(self):
+        """Search for all messages in the current mailbox"""
+        async with self._connection(self.current_mailbox) as client:
+            return await client.search_all()
+            
+    async def search_uid_range(self, uid_set):
+        """Search for the messages of the current mailbox within an IMAP UID set"""
+        async with self._connection(self.current_mailbox) as client:
+            return await client.search_uid_range(uid_set)
+            
+    async def search_chunked(self, chunk_size=10000):
+        """Search for messages in chunks in the current mailbox"""
+        async with self._connection(self.current_mailbox) as client:
+            return await client.search_chunked(chunk_size)
+            
+    async def search_by_date_chunks(self, start_year=None, end_year=None):
+        """Search for messages by date range chunks in the current mailbox"""
+        async with self._connection(self.current_mailbox) as client:
+            return await client.search_by_date_chunks(start_year, end_year)
+            
+    async def list_mailboxes(self):
+        """List all available mailboxes"""
+        async with self._connection() as client:
+            return await client.list_mailboxes()
+            
+    async def close(self):
+        """Close all connections in the pool"""
+        await asyncio.gather(*(client.close() for client in self.clients))
+
 # Obtain or refresh OAuth2 credentials
 def get_credentials(creds_path):
     if not os.path.exists(creds_path):
@@ -944,113 +1250,216 @@ def get_credentials(creds_path):
             token_file.write(creds.to_json())
     return creds
 
+# ISO 8601 timestamps, as written by parse_email_date itself
+_ISO_DATE_RE = re.compile(r'\d{4}-\d{2}-\d{2}T')
+
 # Parse email date into ISO format for better querying
+# Cached because the same Date values repeat a lot (mailing lists, bulk senders)
+@lru_cache(maxsize=4096)
 def parse_email_date(date_str):
     if not date_str:
         return None
+    # Already ISO 8601 (e.g. a value stored by an earlier run): nothing to parse
+    if _ISO_DATE_RE.match(date_str):
+        return date_str
     
     try:
         return parsedate_to_datetime(date_str).isoformat()
-    except:
+    except (TypeError, ValueError, IndexError, OverflowError):
+        # Unparseable dates are stored as received
         return date_str
 
 # Decode MIME headers with better error handling
 def decode_field(field):
     if not field:
         return ''
-    parts = decode_header(field)
-    decoded = ''
-    for part, encoding in parts:
+    # Only RFC 2047 encoded words ("=?charset?...?=") need decoding
+    if isinstance(field, str) and '=?' not in field:
+        return field
+    return _decode_encoded_field(field)
+
+# Mailing lists repeat the same encoded From/Subject values, so cache them
+@lru_cache(maxsize=4096)
+def _decode_encoded_field(field):
+    decoded = []
+    for part, encoding in decode_header(field):
         if isinstance(part, bytes):
-            try:
-                # Handle unknown encodings gracefully
-                if encoding and encoding.lower() == 'unknown-8bit':
-                    decoded += part.decode('utf-8', errors='replace')
-                else:
-                    decoded += part.decode(encoding or 'utf-8', errors='replace')
-            except (LookupError, UnicodeDecodeError):
-                # Fallback to utf-8 with error replacement
-                decoded += part.decode('utf-8', errors='replace')
+            decoded.append(_header_decoder(encoding)(part, 'replace')[0])
         else:
-            decoded += part
-    return decoded
+            decoded.append(part)
+    return ''.join(decoded)
+
+# Stateless UTF-8 decoder: like bytes.decode, it turns a truncated trailing
+# sequence into U+FFFD instead of dropping it (codecs.utf_8_decode defaults to final=False)
+_UTF8_DECODE = codecs.lookup('utf-8').decode
+
+# Resolve a header charset to its decode function once per charset name
+@lru_cache(maxsize=64)
+def _header_decoder(encoding):
+    """Return the decode function for a header charset, falling back to UTF-8
+    
+    Unknown charsets, 'unknown-8bit' and non-text codecs all decode as UTF-8.
+    """
+    if encoding and encoding.lower() != 'unknown-8bit':
+        try:
+            info = codecs.lookup(encoding)
+        except LookupError:
+            info = None
+        # Reject bytes-to-bytes codecs such as base64, uu or zlib
+        if info is not None and getattr(info, '_is_text_encoding', True):
+            return info.decode
+    return _UTF8_DECODE
+
+# Build a compact IMAP UID set, e.g. [10, 11, 12, 20, 30, 31] -> "10:12,20,30:31"
+def compact_uid_set(uids):
+    """Format UIDs as an IMAP sequence set, collapsing consecutive runs into ranges
+    
+    Only runs of consecutive UIDs become ranges, so the set never matches a
+    UID that was not requested.
+    """
+    parts = []
+    run_start = run_end = None
+    for uid in sorted(set(int(uid) for uid in uids)):
+        if run_end is not None and uid == run_end + 1:
+            run_end = uid
+            continue
+        if run_start is not None:
+            parts.append(f"{run_start}:{run_end}" if run_end > run_start else str(run_start))
+        run_start = run_end = uid
+    if run_start is not None:
+        parts.append(f"{run_start}:{run_end}" if run_end > run_start else str(run_start))
+    return ','.join(parts)
+
+# Split UIDs into compact IMAP UID sets of at most `batch` UIDs each
+def chunked_uid_sets(uids, batch=FETCH_BATCH_SIZE):
+    """Yield compact UID sets covering `uids` in ascending order, `batch` UIDs at a time
+    
+    Keeps each command line short when a long, scattered UID list has to be
+    sent to the server, e.g. when checking which failed UIDs still exist.
+    """
+    ordered = sorted(set(int(uid) for uid in uids))
+    for i in range(0, len(ordered), batch):
+        yield compact_uid_set(ordered[i:i + batch])
+
+# Keep the UIDs that are not in an already synced collection, preserving order
+def missing_uids(all_uids, already_synced):
+    """Return the UIDs from `all_uids` that are not in `already_synced`
+    
+    The synced side is turned into a set once, so large mailboxes cost one
+    pass over each input instead of a list scan per UID.
+    """
+    already = already_synced if isinstance(already_synced, (set, frozenset)) else frozenset(already_synced)
+    return [uid for uid in all_uids if uid not in already]
+
+# UID pattern for FETCH response lines, compiled once. imaplib returns the
+# response as bytes, so lines are searched without decoding them first.
+# "UID 123" (also inside "(UID 123") and "UID=123" share one pass.
+_UID_RE = re.compile(rb'UID[ =](\d+)')
 
 # Extract UID from FETCH response
 def extract_uid(response_line):
-    if isinstance(response_line, bytes):
-        response_line = response_line.decode('utf-8', errors='replace')
+    """Return the UID from a FETCH response line (bytes), or None if it has no UID item
     
-    debug_print(f"Parsing response line: {response_line}")
-    
-    # Try different regex patterns to extract UID
-    patterns = [
-        r'UID (\d+)',         # Standard format
-        r'\(UID (\d+)',       # Parenthesized format
-        r'UID=(\d+)',         # Key-value format
-        r'[^\d](\d+)[^\d]'    # Any number surrounded by non-digits
-    ]
+    Other numbers on the line (message sequence numbers, sizes) are never
+    taken for the UID.
+    """
+    if DEBUG:
+        debug_print(f"Parsing response line: {response_line}")
     
-    for pattern in patterns:
-        match = re.search(pattern, response_line)
-        if match:
-            uid = match.group(1)
+    match = _UID_RE.search(response_line)
+    if match:
+        uid = match.group(1).decode('ascii')
+        if DEBUG:
             debug_print(f"  - Extracted UID: {uid}")
-            return uid
+        return uid
     
     debug_print("  - No UID found")
     return None
 
 # Parse IMAP response for UIDs and headers
-def parse_imap_response(data):
-    """Parse the IMAP FETCH response to extract UIDs and header data."""
-    debug_print(f"Response data has {len(data)} elements")
-    
-    # Debug first few elements
-    for i in range(min(2, len(data))):
-        debug_print(f"Data[{i}] type: {type(data[i])}")
-        if isinstance(data[i], bytes):
-            try:
-                debug_print(f"Data[{i}] (first 100 bytes): {data[i][:100]}")
-            except:
-                debug_print(f"Data[{i}]: Unable to print")
-        elif isinstance(data[i], tuple):
-            debug_print(f"Data[{i}] is tuple of length {len(data[i])}")
+def iter_imap_response(data):
+    """Parse the IMAP FETCH response, yielding (uid, data) pairs as they are found"""
+    if not data:
+        return
+    if DEBUG:
+        debug_print(f"Response data has {len(data)} elements")
+        
+        # Debug first few elements
+        for i in range(min(2, len(data))):
+            debug_print(f"Data[{i}] type: {type(data[i])}")
+            if isinstance(data[i], bytes):
+                try:
+                    debug_print(f"Data[{i}] (first 100 bytes): {data[i][:100]}")
+                except:
+                    debug_print(f"Data[{i}]: Unable to print")
+            elif isinstance(data[i], tuple):
+                debug_print(f"Data[{i}] is tuple of length {len(data[i])}")
     
-    messages = []
-    i = 0
+    # imaplib returns each message that has a literal as a (metadata, literal)
+    # tuple followed by the rest of the response line as bytes (usually b')').
+    # The UID is normally in the metadata, but servers may send it after the
+    # literal (b' UID 10)'). A literal without a UID is held until the line that
+    # closes it; it is never paired with a UID from any other message.
+    orphan = None
+    for item in data:
+        if isinstance(item, tuple):
+            if orphan is not None:
+                debug_print("Skipping message data after malformed metadata line (no UID)")
+                orphan = None
+            if len(item) < 2 or not item[1]:
+                continue
+            # imaplib keeps the FETCH metadata (including UID) in the first element
+            uid = extract_uid(item[0])
+            if uid:
+                yield uid, item[1]
+            else:
+                orphan = item[1]
+        elif isinstance(item, bytes) and orphan is not None:
+            # Closing line of the previous literal; it may carry the UID
+            uid = extract_uid(item)
+            if uid:
+                yield uid, orphan
+            else:
+                debug_print("Skipping message data after malformed metadata line (no UID)")
+            orphan = None
+    if orphan is not None:
+        debug_print("Skipping message data after malformed metadata line (no UID)")
+
+# Split a raw header block into its fields without the email package's parser
+_LINE_SPLIT = re.compile(r'\r?\n')
+
+def split_header_fields(header_data):
+    """Return a {lowercase field name: value} dict for a raw header block
     
-    while i < len(data):
-        # For normal IMAP responses, the pattern is usually:
-        # 1. A bytes object with message metadata (including UID)
-        # 2. A tuple containing the message data
-        uid = None
-        header_data = None
-        
-        # Try to extract UID and header data
-        if i < len(data) and isinstance(data[i], bytes):
-            # Try to extract UID from this line
-            uid = extract_uid(data[i])
-            i += 1
-        
-        # Try to get header data from the next element
-        if i < len(data):
-            if isinstance(data[i], tuple) and len(data[i]) > 1:
-                # This is likely the header data tuple
-                header_data = data[i][1]  # Second element is typically the data
-            elif isinstance(data[i], bytes):
-                # Sometimes header data might be directly in bytes
-                header_data = data[i]
-            
-            # If we found header data, process it only if we have a UID
-            if header_data and uid:
-                messages.append((uid, header_data))
-            
-            i += 1
+    Headers mode only fetches a handful of plain header fields, so a single
+    pass over the lines is enough. Like Message.get, the first occurrence of
+    a field wins and folded continuation lines are kept as-is for
+    decode_field to unfold.
+    """
+    end = header_data.find(b'\r\n\r\n')
+    if end != -1:
+        header_data = header_data[:end]
+    try:
+        text = header_data.decode('ascii')
+    except UnicodeDecodeError:
+        text = header_data.decode('utf-8', 'replace')
+        
+    fields = {}
+    name = None
+    for line in _LINE_SPLIT.split(text):
+        if line[:1] in (' ', '\t'):
+            # Continuation of the previous field
+            if name is not None:
+                fields[name] += '\r\n' + line
+            continue
+        key, sep, value = line.partition(':')
+        key = key.lower()
+        if sep and key not in fields:
+            name = key
+            fields[name] = value.lstrip(' \t')
         else:
-            i += 1
-    
-    debug_print(f"Extracted {len(messages)} message pairs")
-    return messages
+            name = None
+    return fields
 
 # Email processor class for fetching and syncing emails
 class EmailSyncer:
@@ -1071,6 +1480,9 @@ class EmailSyncer:
         self.last_status_id = None
         self.failed_uids = self.checkpoint.get_failed_uids()
         self.emails_since_commit = 0
+        self.processed_count = 0
+        self.saved_count = 0
+        self.skipped_count = 0
         self.pbar = None
 
     async def start_sync(self, message):
@@ -1083,98 +1495,182 @@ class EmailSyncer:
         await self.db_manager.log_sync_end(self.last_status_id, status, message)
         self.checkpoint.mark_complete()
         
-    async def process_headers(self, uid, mailbox):
-        """Process email headers for a single UID"""
-        # Fetch headers
-        status, data = await self.imap_client.fetch(uid, 'headers')
-        if status != 'OK':
-            debug_print(f"Failed to fetch headers for UID {uid}: {status}")
-            self.checkpoint.add_failed_uid(uid)
-            return 'fail'
-            
-        # Extract header data
-        header_data = None
-        for item in data:
-            if isinstance(item, tuple) and len(item) > 1:
-                header_data = item[1]
-                break
-        
-        if not header_data:
-            debug_print(f"No header data found for UID {uid}")
-            self.checkpoint.add_failed_uid(uid)
-            return 'fail'
-            
-        # Parse email headers
-        msg = email.message_from_bytes(header_data if isinstance(header_data, bytes) else header_data.encode('utf-8'))
-        date_str = decode_field(msg.get('Date', ''))
+    def _parse_headers(self, uid, mailbox, header_data):
+        """Parse raw header data into a row for the emails table"""
+        fields = split_header_fields(header_data if isinstance(header_data, bytes) else header_data.encode('utf-8'))
+        date_str = decode_field(fields.get('date', ''))
         iso_date = parse_email_date(date_str)
         
-        # Save headers to database
-        await self.db.execute(
-            'INSERT OR REPLACE INTO emails(uid, msg_from, msg_to, msg_cc, subject, msg_date, mailbox) VALUES(?,?,?,?,?,?,?)',
-            (
-                uid,
-                decode_field(msg.get('From', '')),
-                decode_field(msg.get('To', '')),
-                decode_field(msg.get('Cc', '')),
-                decode_field(msg.get('Subject', '')),
-                iso_date,
-                mailbox
-            )
+        return (
+            uid,
+            decode_field(fields.get('from', '')),
+            decode_field(fields.get('to', '')),
+            decode_field(fields.get('cc', '')),
+            decode_field(fields.get('subject', '')),
+            iso_date,
+            mailbox
         )
         
-        # Update checkpoint and return success
-        self.checkpoint.update_progress(uid)
-        if uid in self.failed_uids:
-            self.checkpoint.clear_failed_uid(uid)
-        return 'saved'
-        
-    async def process_full_email(self, uid, mailbox):
-        """Process full email content for a single UID"""
-        debug_print(f"Fetching full email for UID {uid} in mailbox {mailbox}...")
-        
-        # Fetch full email
-        status, data = await self.imap_client.fetch(uid, 'full')
-        if status != 'OK' or not data:
-            print(f"[ERROR] Failed to fetch UID {uid}: status={status}, data_len={len(data) if data else 0}")
-            self.checkpoint.add_failed_uid(uid)
-            return 'fail'
-            
-        debug_print(f"Received data for UID {uid}, processing...")
-        
-        # Extract raw email data
-        raw_email = None
-        for item in data:
-            if isinstance(item, tuple) and len(item) > 1:
-                raw_email = item[1]
-                break
+    def _batches(self, uids_to_fetch):
+        """Split (uid, mailbox) pairs into per-mailbox UID batches
+        
+        Batches never cross a CHUNK_SIZE boundary; the last batch of each
+        chunk is flagged so the writer can commit at the end of the chunk.
+        """
+        batch_size = FETCH_BATCH_SIZE if self.mode == 'headers' else FULL_FETCH_BATCH_SIZE
+        for i in range(0, len(uids_to_fetch), CHUNK_SIZE):
+            chunk = uids_to_fetch[i:i + CHUNK_SIZE]
+            batch, batch_mailbox = [], None
+            for uid, mbox in chunk:
+                if batch and (mbox != batch_mailbox or len(batch) >= batch_size):
+                    yield batch_mailbox, batch, False
+                    batch = []
+                batch.append(uid)
+                batch_mailbox = mbox
+            if batch:
+                yield batch_mailbox, batch, True
                 
-        if not raw_email:
-            if self.pbar and self.pbar.n < 10:
-                debug_print(f"[DEBUG] No raw email data found for UID {uid} in mailbox {mailbox}. Data: {data}")
-            self.checkpoint.add_failed_uid(uid)
-            return 'fail'
+    async def _fetch_batch(self, batch, mailbox):
+        """Fetch a batch of UIDs, retrying any that failed once
+        
+        Transient failures (a dropped response, a connection blip) are
+        retried in the same run with a single fetch of the missing UIDs,
+        instead of being recorded as failed until the next sync.
+        
+        Returns a dict mapping UIDs to their fetched data, or None if the
+        whole batch could not be fetched.
+        """
+        fetched = await self._try_fetch_batch(batch, mailbox)
+        missing = batch if fetched is None else [uid for uid in batch if not fetched.get(uid)]
+        if not missing:
+            return fetched
             
-        # Save full email to database
-        await self.db.execute(
-            'INSERT OR REPLACE INTO full_emails(uid, mailbox, raw_email, fetched_at) VALUES(?,?,?,?)',
-            (uid, mailbox, raw_email, datetime.datetime.now().isoformat())
-        )
+        debug_print(f"Retrying {len(missing)} of {len(batch)} UIDs from {mailbox}")
+        retried = await self._try_fetch_batch(missing, mailbox)
+        if retried is None:
+            return fetched
+        if fetched is None:
+            return retried
+        fetched.update(retried)
+        return fetched
+        
+    async def _try_fetch_batch(self, batch, mailbox):
+        """Select the mailbox and fetch a batch of UIDs
+        
+        Returns a dict mapping UIDs to their fetched data, or None if the
+        whole batch could not be fetched.
+        """
+        try:
+            # select_mailbox is a no-op when the mailbox is already selected
+            if not await self.imap_client.select_mailbox(mailbox):
+                return None
+                
+            status, fetched = await self.imap_client.fetch_many(batch, self.mode)
+            if status != 'OK':
+                debug_print(f"Failed to fetch {self.mode} for {len(batch)} UIDs: {status}")
+                return None
+            return fetched
+        except Exception as e:
+            debug_print(f"Error fetching UIDs {batch[0]}..{batch[-1]} from {mailbox}: {e}")
+            return None
+            
+    async def _fetch_and_parse(self, batch, mailbox):
+        """Fetch stage of the pipeline: fetch a batch and turn it into rows
+        
+        Parsing here lets it run while the writer waits on the database,
+        instead of delaying the write of the batch.
+        """
+        return self._parse_batch(batch, mailbox, await self._fetch_batch(batch, mailbox))
         
-        # Update checkpoint and return success
-        if self.pbar and self.pbar.n < 10:
-            print(f"[DEBUG] Successfully saved full email for UID {uid} in mailbox {mailbox}.")
+    def _parse_batch(self, batch, mailbox, fetched):
+        """Build database rows for a fetched batch
+        
+        Returns the rows and a dict mapping each UID to 'saved' (row built)
+        or 'fail'.
+        """
+        if fetched is None:
+            return [], dict.fromkeys(batch, 'fail')
             
-        self.checkpoint.update_progress(uid)
-        if uid in self.failed_uids:
-            self.checkpoint.clear_failed_uid(uid)
-        return 'saved'
+        results = {}
+        rows = []
+        fetched_at = _now_iso()
+        for uid in batch:
+            data = fetched.get(uid)
+            if not data:
+                debug_print(f"No data found for UID {uid}")
+                results[uid] = 'fail'
+                continue
+            try:
+                # Rows are written together with a single executemany
+                if self.mode == 'headers':
+                    rows.append(self._parse_headers(uid, mailbox, data))
+                else:
+                    rows.append((uid, mailbox, data, fetched_at))
+            except Exception as e:
+                debug_print(f"Error processing UID {uid}: {e}")
+                results[uid] = 'fail'
+                continue
+            results[uid] = 'saved'
+        return rows, results
+        
+    async def _save_batch(self, rows, results):
+        """Save a parsed batch to the database, returning a result per UID"""
+        if rows:
+            try:
+                if self.mode == 'headers':
+                    await self.db_manager.save_email_headers_bulk(rows)
+                else:
+                    await self.db_manager.save_full_emails_bulk(rows)
+            except Exception as e:
+                debug_print(f"Error saving {self.mode} for {len(rows)} UIDs: {e}")
+                results = dict.fromkeys(results, 'fail')
+                
+        # Update checkpoint once for the whole batch
+        saved_uids = [uid for uid, result in results.items() if result == 'saved']
+        self.checkpoint.add_failed_uids([uid for uid, result in results.items() if result == 'fail'])
+        self.checkpoint.update_progress_bulk(saved_uids)
+        self.checkpoint.clear_failed_uids(saved_uids)
+        return list(results.values())
+        
+    async def _write_batch(self, batch, parsed, end_of_chunk):
+        """Save a parsed batch, update counters and commit when due"""
+        for result in await self._save_batch(*parsed):
+            if result == 'fail':
+                self.skipped_count += 1
+            elif result == 'saved':
+                self.saved_count += 1
+                self.processed_count += 1
+                
+        self.pbar.update(len(batch))
+        self.emails_since_commit += len(batch)
+        
+        # Commit periodically and after every chunk
+        if self.emails_since_commit >= EMAILS_PER_COMMIT or end_of_chunk:
+            # A failed commit keeps its rows in the open transaction for the
+            # next one; the checkpoint waits until they are committed
+            if await self.db_manager.commit_with_retry():
+                self.checkpoint.save_state()
+            self.emails_since_commit = 0
+            
+    async def _write_fetched(self, item):
+        """Wait for a pending fetch and write its batch"""
+        fetch_task, batch, mailbox, end_of_chunk = item
+        await self._write_batch(batch, await fetch_task, end_of_chunk)
         
     async def run(self, uids_to_fetch, total_count, fetch_mode_desc):
-        """Run the sync process for a list of UIDs"""
-        processed_count = 0
-        skipped_count = 0
-        saved_count = 0
+        """Run the sync process for a list of UIDs
+        
+        Fetching (with parsing) and saving are overlapped: while one batch
+        is written to the database, the next batches are already being
+        fetched from IMAP and parsed into rows.
+        Up to one fetch per IMAP connection is in flight (capped by
+        CONCURRENT_FETCHES), since a connection cannot be shared by
+        concurrent commands. Batches are written in UID order by this
+        coroutine alone, so database commits stay serial.
+        """
+        self.processed_count = 0
+        self.skipped_count = 0
+        self.saved_count = 0
         self.emails_since_commit = 0
         
         if DEBUG:
@@ -1186,71 +1682,50 @@ class EmailSyncer:
                 sample_failed = self.failed_uids[:min(10, len(self.failed_uids))]
                 print(f"[DEBUG] First {len(sample_failed)} failed UIDs: {sample_failed}")
         
-        self.pbar = tqdm(total=total_count, desc=f'Fetching {fetch_mode_desc}')
-        prev_mailbox = None
+        self.pbar = tqdm(total=total_count, desc=f'Fetching {fetch_mode_desc}', mininterval=0.5)
         
+        window = max(1, min(CONCURRENT_FETCHES, getattr(self.imap_client, 'connection_count', 1)))
+        pending = deque()  # (fetch task, batch, mailbox, end_of_chunk), oldest first
         try:
-            for chunk_idx, i in enumerate(range(0, len(uids_to_fetch), CHUNK_SIZE)):
-                chunk = uids_to_fetch[i:i + CHUNK_SIZE]
-                if not chunk:
-                    continue
-                
-                for uid, mbox in chunk:
-                    is_retry = uid in self.failed_uids
-                    try:
-                        # Select the correct mailbox before fetching
-                        if prev_mailbox != mbox:
-                            if not await self.imap_client.select_mailbox(mbox):
-                                self.checkpoint.add_failed_uid(uid)
-                                skipped_count += 1
-                                self.pbar.update(1)
-                                continue
-                            prev_mailbox = mbox
-                            
-                        # Process email based on mode
-                        if self.mode == 'headers':
-                            result = await self.process_headers(uid, mbox)
-                        else:  # full mode
-                            result = await self.process_full_email(uid, mbox)
-                            
-                        if result == 'fail':
-                            skipped_count += 1
-                        elif result == 'saved':
-                            saved_count += 1
-                            processed_count += 1
+            try:
+                for mbox, batch, end_of_chunk in self._batches(uids_to_fetch):
+                    # The selected mailbox is shared, so only fetch one mailbox at a time
+                    if pending and pending[-1][2] != mbox:
+                        while pending:
+                            await self._write_fetched(pending.popleft())
                             
-                        self.pbar.update(1)
-                        self.emails_since_commit += 1
+                    # Wait for the oldest fetch when every connection is busy
+                    ready = None
+                    if len(pending) >= window:
+                        ready = pending.popleft()
+                        await ready[0]
                         
-                        # Commit periodically
-                        if self.emails_since_commit >= EMAILS_PER_COMMIT:
-                            self.checkpoint.save_state()
-                            await self.db_manager.commit_with_retry()
-                            self.emails_since_commit = 0
-                            
-                    except Exception as e:
-                        debug_print(f"Error processing UID {uid}: {e}")
-                        self.checkpoint.add_failed_uid(uid)
-                        skipped_count += 1
-                        self.pbar.update(1)
+                    # Start fetching this batch, then save the finished one while it downloads
+                    pending.append((asyncio.ensure_future(self._fetch_and_parse(batch, mbox)), batch, mbox, end_of_chunk))
+                    if ready:
+                        await self._write_fetched(ready)
+                        
+                while pending:
+                    await self._write_fetched(pending.popleft())
+            finally:
+                for fetch_task, *_ in pending:
+                    if not fetch_task.done():
+                        fetch_task.cancel()
                         
-                # Commit after each chunk
-                if chunk_idx % 1 == 0:  # Commit after every chunk
-                    self.checkpoint.save_state()
-                    await self.db_manager.commit_with_retry()
-                    
             # Final commit
             await self.db.commit()
-            await self.finish_sync('COMPLETED', f'Successfully processed {saved_count} {fetch_mode_desc}')
+            await self.finish_sync('COMPLETED', f'Successfully processed {self.saved_count} {fetch_mode_desc}')
             
         except KeyboardInterrupt:
             print("\nOperation interrupted by user. Saving progress...")
             try:
-                await self.db.commit()
-                await self.finish_sync('INTERRUPTED', 'Interrupted by user')
-                self.checkpoint.save_state()
-                print(f"Progress saved. Last processed UID: {self.checkpoint.get_last_uid()}")
-                print(f"Failed UIDs count: {len(self.checkpoint.get_failed_uids())}")
+                if await self.db_manager.commit_with_retry():
+                    await self.finish_sync('INTERRUPTED', 'Interrupted by user')
+                    self.checkpoint.save_state()
+                    print(f"Progress saved. Last processed UID: {self.checkpoint.get_last_uid()}")
+                    print(f"Failed UIDs count: {len(self.checkpoint.get_failed_uids())}")
+                else:
+                    print("Pending changes could not be committed; checkpoint left unchanged")
             except Exception as e:
                 print(f"Error saving progress: {e}")
             raise
@@ -1258,25 +1733,71 @@ class EmailSyncer:
         except Exception as e:
             print(f"\nUnexpected error: {e}")
             try:
-                await self.db.commit()
-                await self.finish_sync('ERROR', str(e)[:200])
-                self.checkpoint.save_state()
-                print(f"Partial progress saved. Last processed UID: {self.checkpoint.get_last_uid()}")
-                print(f"Failed UIDs count: {len(self.checkpoint.get_failed_uids())}")
+                if await self.db_manager.commit_with_retry():
+                    await self.finish_sync('ERROR', str(e)[:200])
+                    self.checkpoint.save_state()
+                    print(f"Partial progress saved. Last processed UID: {self.checkpoint.get_last_uid()}")
+                    print(f"Failed UIDs count: {len(self.checkpoint.get_failed_uids())}")
+                else:
+                    print("Pending changes could not be committed; checkpoint left unchanged")
             except Exception as commit_err:
                 print(f"Error saving progress: {commit_err}")
             raise
             
         finally:
             if self.pbar:
-                self.pbar.n = processed_count
+                self.pbar.n = self.processed_count
                 self.pbar.refresh()
                 self.pbar.close()
-                print(f"Successfully processed {processed_count} messages")
-                print(f"Saved {saved_count} {fetch_mode_desc} to database")
-                print(f"Skipped {skipped_count} messages")
+                print(f"Successfully processed {self.processed_count} messages")
+                print(f"Saved {self.saved_count} {fetch_mode_desc} to database")
+                print(f"Skipped {self.skipped_count} messages")
                 
-        return processed_count, saved_count, skipped_count
+        return self.processed_count, self.saved_count, self.skipped_count
+
+async def get_last_saved_uid(db_manager, mailbox):
+    """Get the highest UID stored in the emails table for a mailbox"""
+    async with db_manager.db.execute("SELECT MAX(CAST(uid AS INTEGER)) FROM emails WHERE mailbox = ?", (mailbox,)) as cursor:
+        row = await cursor.fetchone()
+    return int(row[0]) if row and row[0] else 0
+
+async def get_saved_uids(db_manager, mailbox, uids):
+    """Return the subset of `uids` already stored in the emails table for a mailbox"""
+    saved = set()
+    uids = list(uids)
+    # Stay well below SQLite's limit on bound parameters per statement
+    for i in range(0, len(uids), 500):
+        chunk = uids[i:i + 500]
+        placeholders = ','.join('?' * len(chunk))
+        rows = await db_manager.db.execute_fetchall(
+            f'SELECT uid FROM emails WHERE mailbox = ? AND uid IN ({placeholders})',
+            (mailbox, *chunk)
+        )
+        saved.update(str(row[0]) for row in rows)
+    return saved
+
+async def search_mailbox_uids(imap_client, mailbox, after_uid=0):
+    """Search UIDs in the selected mailbox, using chunked searches for huge mailboxes
+    
+    With `after_uid`, only UIDs above it are requested from the server.
+    """
+    # Resuming: let the server return just the new messages
+    if after_uid > 0:
+        uids = await imap_client.search_uid_range(f'{after_uid + 1}:*')
+        return [uid for uid in uids if int(uid) > after_uid]
+    # For the exceptionally large "[Gmail]/All Mail" mailbox, use date-based search
+    if mailbox == '[Gmail]/All Mail':
+        print("Using date-based search for [Gmail]/All Mail mailbox")
+        return await imap_client.search_by_date_chunks(start_year=2000)
+    # For other large mailboxes, use chunked search
+    elif mailbox in ['[Gmail]/Mail'] or 'All Mail' in mailbox:
+        try:
+            return await imap_client.search_chunked()
+        except Exception as e:
+            print(f"Chunked search failed: {e}. Falling back to date-based search.")
+            return await imap_client.search_by_date_chunks(start_year=2000)
+    else:
+        return await imap_client.search_all()
 
 async def sync_email_headers(db_manager, imap_client, mailbox='INBOX'):
     """Synchronize email headers from IMAP server to database"""
@@ -1294,11 +1815,7 @@ async def sync_email_headers(db_manager, imap_client, mailbox='INBOX'):
             
         # Get the last processed UID from checkpoint
         last_uid = syncer.checkpoint.get_last_uid()
-        
-        # Check if we have a last UID in the database
-        async with db_manager.db.execute("SELECT MAX(CAST(uid AS INTEGER)) FROM emails WHERE mailbox = ?", (mailbox,)) as cursor:
-            row = await cursor.fetchone()
-        last_uid_db = int(row[0]) if row and row[0] else 0
+        last_uid_db = await get_last_saved_uid(db_manager, mailbox)
         
         # Use the minimum of the two to ensure we don't miss any emails
         if last_uid > 0 and last_uid_db > 0:
@@ -1308,38 +1825,41 @@ async def sync_email_headers(db_manager, imap_client, mailbox='INBOX'):
             
         print(f"Resuming from UID > {last_uid}")
         
-        # Get failed UIDs that need to be retried
-        failed_uids = syncer.checkpoint.get_failed_uids()
+        # Get failed UIDs whose retry delay has passed
+        failed_uids = syncer.checkpoint.get_retry_uids()
         if failed_uids:
             print(f"Found {len(failed_uids)} failed UIDs from previous runs. Will retry these.")
             
-        # For the exceptionally large "[Gmail]/All Mail" mailbox, use date-based search
-        if mailbox == '[Gmail]/All Mail':
-            print("Using date-based search for [Gmail]/All Mail mailbox")
-            all_uids = await imap_client.search_by_date_chunks(start_year=2000)
-        # For other large mailboxes, use chunked search
-        elif mailbox in ['[Gmail]/Mail'] or 'All Mail' in mailbox:
-            try:
-                all_uids = await imap_client.search_chunked()
-            except Exception as e:
-                print(f"Chunked search failed: {e}. Falling back to date-based search.")
-                all_uids = await imap_client.search_by_date_chunks(start_year=2000)
-        else:
-            all_uids = await imap_client.search_all()
-            
-        if not all_uids:
+        # Search only for new UIDs (greater than the last processed UID)
+        new_uids = await search_mailbox_uids(imap_client, mailbox, after_uid=last_uid)
+        if last_uid == 0 and not new_uids:
             print("No emails found in mailbox.")
             await syncer.finish_sync('COMPLETED', 'No emails found in mailbox')
             return
             
-        # Filter for new UIDs (greater than the last processed UID)
-        new_uids = [uid for uid in all_uids if int(uid) > last_uid]
-        
+        # Failed UIDs above last_uid come back in that search; hold back those not yet due
+        deferred_uids = syncer.checkpoint.get_deferred_uids()
+        if deferred_uids:
+            kept = missing_uids(new_uids, deferred_uids)
+            if len(kept) < len(new_uids):
+                print(f"Deferring {len(new_uids) - len(kept)} failed UIDs until their retry delay has passed")
+            new_uids = kept
+            
         # Add failed UIDs to be retried
         if failed_uids:
-            failed_uids_str = [str(uid) for uid in failed_uids]
-            retry_uids = [uid for uid in failed_uids_str if uid in all_uids]
-            retry_uids = [uid for uid in retry_uids if uid not in new_uids]
+            # Older failed UIDs are not in the search above; keep those still on the server
+            failed_uids_str = [str(uid) for uid in failed_uids if int(uid) <= last_uid]
+            retry_uids = []
+            for uid_set in chunked_uid_sets(failed_uids_str):
+                retry_uids.extend(await imap_client.search_uid_range(uid_set))
+            
+            # Failed UIDs whose headers were stored since then need no fetch
+            already_saved = await get_saved_uids(db_manager, mailbox, retry_uids)
+            if already_saved:
+                print(f"Skipping {len(already_saved)} failed UIDs already in the database")
+                syncer.checkpoint.clear_failed_uids(already_saved)
+                retry_uids = missing_uids(retry_uids, already_saved)
+                
             new_uids.extend(retry_uids)
             new_uids.sort(key=int)
             
@@ -1369,38 +1889,36 @@ async def sync_full_emails(db_manager, imap_client, mailbox='INBOX'):
     await syncer.start_sync(f'Starting full email sync for {mailbox}')
     
     try:
-        # Get all email UIDs from the headers table for this mailbox
-        async with db_manager.db.execute('SELECT uid, mailbox FROM emails WHERE mailbox = ?', (mailbox,)) as cursor:
-            all_rows = await cursor.fetchall()
-        all_uids = [(str(row[0]), row[1]) for row in all_rows]
-        
-        print(f"Found {len(all_uids)} total emails in database for mailbox {mailbox}")
-        
-        # Get already fetched UIDs
-        async with db_manager.db.execute('SELECT uid FROM full_emails WHERE mailbox = ?', (mailbox,)) as cursor:
-            fetched_rows = await cursor.fetchall()
+        # Get all email UIDs from the headers table and the already fetched UIDs
+        # (both queries are queued on the database thread together)
+        all_rows, fetched_rows = await asyncio.gather(
+            db_manager.db.execute_fetchall('SELECT uid FROM emails WHERE mailbox = ?', (mailbox,)),
+            db_manager.db.execute_fetchall('SELECT uid FROM full_emails WHERE mailbox = ?', (mailbox,))
+        )
+        all_uids = [str(row[0]) for row in all_rows]
         fetched_uids = set(str(row[0]) for row in fetched_rows)
         
+        print(f"Found {len(all_uids)} total emails in database for mailbox {mailbox}")
         print(f"Already fetched {len(fetched_uids)} full emails")
         
-        # Get failed UIDs from previous runs
-        failed_uids = syncer.checkpoint.get_failed_uids()
+        # Get failed UIDs from previous runs, holding back those still in their retry delay
+        failed_uids = syncer.checkpoint.get_retry_uids()
         if failed_uids:
             print(f"Found {len(failed_uids)} failed UIDs from previous full-email fetches. Will retry these.")
             print(f"First 5 failed UIDs: {failed_uids[:5] if len(failed_uids) > 5 else failed_uids}")
+        deferred_uids = syncer.checkpoint.get_deferred_uids()
+        if deferred_uids:
+            print(f"Deferring {len(deferred_uids)} failed UIDs until their retry delay has passed")
         
-        # Determine which UIDs need to be fetched
-        uids_to_fetch = [(uid, mbox) for (uid, mbox) in all_uids if uid not in fetched_uids]
-        retry_uids = [(uid, mbox) for (uid, mbox) in all_uids if uid in failed_uids and uid not in fetched_uids]
+        # Determine which UIDs need to be fetched; failed UIDs past their retry
+        # delay are not fetched yet, so they are already part of this list
+        uids_to_fetch = [(uid, mailbox) for uid in missing_uids(all_uids, fetched_uids | deferred_uids)]
+        failed_uid_set = set(str(uid) for uid in failed_uids)
+        retry_count = sum(1 for uid, _ in uids_to_fetch if uid in failed_uid_set)
         
         print(f"UIDs needing full email fetch: {len(uids_to_fetch)}")
-        print(f"Failed UIDs to retry: {len(retry_uids)}")
+        print(f"Failed UIDs to retry: {retry_count}")
         
-        # Add retry UIDs if they're not already in the fetch list
-        for item in retry_uids:
-            if item not in uids_to_fetch:
-                uids_to_fetch.append(item)
-                
         total_count = len(uids_to_fetch)
         print(f"Total UIDs to fetch: {total_count}")
         
@@ -1506,11 +2024,14 @@ async def list_available_queries():
             for param_name, default_value in details['params'].items():
                 print(f"    --{param_name}={default_value}")
 
+# A filename or name MIME parameter, in any case and possibly spaced or RFC 2231
+# encoded (Name=, filename = "x", FILENAME*=, name*0*=)
+_ATTACHMENT_NAME_RE = re.compile(rb'name[\s*0-9]*=', re.IGNORECASE)
+
 async def sync_attachments(db_manager, mailbox='INBOX'):
     """Extract attachments from full_emails and populate normalized attachment tables."""
-    import email as pyemail
     from email import policy
-    import hashlib
+    from email.parser import BytesFeedParser
 
     # Create a checkpoint manager for tracking progress
     checkpoint = CheckpointManager('attachments', mailbox)
@@ -1572,81 +2093,106 @@ async def sync_attachments(db_manager, mailbox='INBOX'):
     
     await db_manager.db.commit()
     
-    # Get the last processed UID from checkpoint
-    last_uid = checkpoint.get_last_uid()
+    # Every stored email is scanned on each run: full_emails is not filled in UID
+    # order (failed UIDs are fetched later), so a UID high-water mark would skip
+    # emails. The INSERT OR IGNOREs below make rescans idempotent. Pages are
+    # keyed on rowid, so each query is a range seek on the mailbox index.
+    last_rowid = 0
     
-    print(f"Processing attachments for mailbox '{mailbox}', starting from UID > {last_uid}")
+    print(f"Processing attachments for mailbox '{mailbox}'")
 
-    # Query to get all emails that have attachments
+    async with db_manager.db.execute(
+        'SELECT COUNT(*) FROM full_emails WHERE mailbox = ?', (mailbox,)
+    ) as cursor:
+        total = (await cursor.fetchone())[0]
+
+    # Read emails a page at a time instead of loading every raw email in memory
     query = '''
-        SELECT uid, mailbox, full_content 
+        SELECT rowid, uid, mailbox, raw_email 
         FROM full_emails
-        WHERE mailbox = ? AND CAST(uid AS INTEGER) > ?
-        ORDER BY CAST(uid AS INTEGER)
+        WHERE rowid > ? AND mailbox = ?
+        ORDER BY rowid
+        LIMIT ?
     '''
-    async with db_manager.db.execute(query, (mailbox, last_uid)) as cursor:
-        rows = await cursor.fetchall()
 
     # Process emails
     count = 0
-    pbar = tqdm.tqdm(total=len(rows), desc=f"Extracting attachments from {mailbox}")
+    pbar = tqdm(total=total, desc=f"Extracting attachments from {mailbox}", mininterval=0.5)
     
-    for row in rows:
-        uid, mailbox, content = row
-        try:
-            # Parse the email
-            msg = pyemail.message_from_bytes(content, policy=policy.default)
-            
-            # Find attachments
-            for part in msg.iter_attachments():
-                filename = part.get_filename()
-                if not filename:
-                    continue
-                    
-                # Get content
-                content = part.get_content()
-                size = len(content)
+    while True:
+        async with db_manager.db.execute(query, (last_rowid, mailbox, ATTACHMENT_PAGE_SIZE)) as cursor:
+            rows = await cursor.fetchall()
+        if not rows:
+            break
+        last_rowid = rows[-1][0]
+        
+        for row in rows:
+            _, uid, mailbox, raw_email = row
+            # Only parts with a filename are kept below, so emails without any
+            # name parameter are not worth MIME-parsing
+            if not _ATTACHMENT_NAME_RE.search(raw_email or b''):
+                continue
+            try:
+                # Parse the email
+                parser = BytesFeedParser(policy=policy.default)
+                parser.feed(raw_email)
+                msg = parser.close()
                 
-                # Skip empty attachments
-                if size == 0:
-                    continue
+                # Find attachments
+                for part in msg.iter_attachments():
+                    filename = part.get_filename()
+                    if not filename:
+                        continue
+                        
+                    # Decode only the parts we keep, always as bytes
+                    content = part.get_payload(decode=True)
+                    size = len(content) if content else 0
                     
-                # Compute SHA-256
-                sha = hashlib.sha256(content).hexdigest()
-                
-                # Try to insert into blob table (will be ignored if exists)
-                try:
-                    await db_manager.db.execute('''
-                        INSERT OR IGNORE INTO attachment_blobs (sha256, content, size)
-                        VALUES (?, ?, ?)
-                    ''', (sha, content, size))
-                except Exception as e:
-                    print(f"Error storing blob {sha}: {e}")
-                    continue
-                
-                # Insert into mapping table
-                try:
-                    await db_manager.db.execute('''
-                        INSERT OR IGNORE INTO email_attachments (uid, mailbox, sha256, filename)
-                        VALUES (?, ?, ?, ?)
-                    ''', (uid, mailbox, sha, filename))
+                    # Skip empty attachments
+                    if size == 0:
+                        continue
+                        
+                    # Compute SHA-256
+                    sha = hashlib.sha256(content).hexdigest()
                     
-                    count += 1
+                    # Try to insert into blob table (will be ignored if exists)
+                    try:
+                        await db_manager.db.execute('''
+                            INSERT OR IGNORE INTO attachment_blobs (sha256, content, size)
+                            VALUES (?, ?, ?)
+                        ''', (sha, content, size))
+                    except Exception as e:
+                        print(f"Error storing blob {sha}: {e}")
+                        continue
                     
-                    # Commit every 100 attachments
-                    if count % 100 == 0:
-                        await db_manager.db.commit()
+                    # Insert into mapping table
+                    try:
+                        await db_manager.db.execute('''
+                            INSERT OR IGNORE INTO email_attachments (uid, mailbox, sha256, filename)
+                            VALUES (?, ?, ?, ?)
+                        ''', (uid, mailbox, sha, filename))
                         
-                except Exception as e:
-                    print(f"Error mapping attachment {filename} to email {uid}: {e}")
-                    continue
-            
-        except Exception as e:
-            print(f"Error processing email {uid}: {e}")
-            checkpoint.add_failed_uid(uid)
-            continue
+                        count += 1
+                        
+                        # Commit every 100 attachments
+                        if count % 100 == 0:
+                            await db_manager.db.commit()
+                            
+                    except Exception as e:
+                        print(f"Error mapping attachment {filename} to email {uid}: {e}")
+                        continue
+                
+            except Exception as e:
+                print(f"Error processing email {uid}: {e}")
+                checkpoint.add_failed_uid(uid)
+                continue
             
-        pbar.update(1)
+        # Advance the bar once per page rather than once per email
+        pbar.update(len(rows))
+        
+        # Commit after each page and save any failed UIDs
+        await db_manager.db.commit()
+        checkpoint.save_state()
         
     pbar.close()
     await db_manager.db.commit()
@@ -1727,6 +2273,15 @@ async def run_analytics(db_manager, args):
     else:
         await analytics_email_density(db_manager, year=args.year, metric=metric)
 
+def create_imap_client(args, creds):
+    """Create a single IMAP client, or a pool when more connections are requested"""
+    connections = min(args.connections, MAX_IMAP_CONNECTIONS)
+    if connections < args.connections:
+        print(f"Limiting IMAP connections to {connections} (server maximum)")
+    if connections > 1:
+        return ImapClientPool(args.host, args.user, creds, size=connections)
+    return ImapClient(args.host, args.user, creds)
+
 async def main():
     parser = argparse.ArgumentParser(description='Fetch Gmail emails to SQLite using OAuth2')
     parser.add_argument('--db', default='mail.sqlite3', help='Path to SQLite database')
@@ -1737,6 +2292,7 @@ async def main():
     parser.add_argument('--all-mailboxes', action='store_true', help='Sync all mailboxes (headers, full, attachments modes)')
     parser.add_argument('--debug', action='store_true', help='Enable debug mode')
     parser.add_argument('--list-mailboxes', action='store_true', help='List available mailboxes and exit')
+    parser.add_argument('--connections', type=int, default=1, help='Number of IMAP connections to use for sync modes (default: 1)')
     parser.add_argument('--mode', choices=['headers', 'full', 'query', 'attachments', 'analytics'], default='headers', 
                         help='Execution mode: headers (default), full (fetch full emails), attachments (extract and normalize attachments), analytics (run analytics), or query (run queries)')
     
@@ -1755,8 +2311,7 @@ async def main():
     
     args = parser.parse_args()
     
-    global DEBUG
-    DEBUG = args.debug or DEBUG
+    set_debug(args.debug or DEBUG)
 
     # Query mode doesn't require credentials
     if args.mode == 'query' or args.list_queries:
@@ -1815,7 +2370,7 @@ async def main():
             return
         # Sync emails based on mode
         if args.mode == 'headers':
-            imap_client = ImapClient(args.host, args.user, creds)
+            imap_client = create_imap_client(args, creds)
             await imap_client.connect()
             if args.all_mailboxes:
                 mailboxes = await imap_client.list_mailboxes()
@@ -1833,7 +2388,7 @@ async def main():
             else:
                 await sync_email_headers(db_manager, imap_client, args.mailbox)
         elif args.mode == 'full':
-            imap_client = ImapClient(args.host, args.user, creds)
+            imap_client = create_imap_client(args, creds)
             await imap_client.connect()
             if args.all_mailboxes:
                 mailboxes = await imap_client.list_mailboxes()
@@ -1873,8 +2428,21 @@ async def main():
         await db_manager.close()
 
 if __name__ == '__main__':
+    # Prefer uvloop's event loop when it is installed (it does not support Windows)
+    run = asyncio.run
+    if sys.platform != 'win32':
+        try:
+            import uvloop
+            if hasattr(uvloop, 'run'):
+                run = uvloop.run
+            else:
+                # uvloop before 0.18 has no run(); install its event loop policy instead
+                uvloop.install()
+        except ImportError:
+            pass
+            
     try:
-        asyncio.run(main())
+        run(main())
     except KeyboardInterrupt:
         print("\nProgram terminated by user")
     except Exception as e: